@@ -0,0 +1,14 @@
+"""
+ASGI entry points for running the mock services under an ASGI server
+(e.g. uvicorn) instead of the Werkzeug development server.
+"""
+
+from asgiref.wsgi import WsgiToAsgi
+
+from wsgi import crm_app as crm_wsgi_app
+from wsgi import erp_app as erp_wsgi_app
+from wsgi import email_app as email_wsgi_app
+
+crm_app = WsgiToAsgi(crm_wsgi_app)
+erp_app = WsgiToAsgi(erp_wsgi_app)
+email_app = WsgiToAsgi(email_wsgi_app)
@@ -1,8 +1,15 @@
-from flask import Flask, jsonify, request
+from flask import Response, jsonify, request
 from datetime import datetime
-import uuid
+from collections import defaultdict, deque
+import itertools
+import secrets
+import sys
+import threading
+import time
+import orjson
+from service_utils import create_app, run_app, to_cents
 
-app = Flask(__name__)
+app = create_app(__name__)
 
 # Mock CRM database
 customers = {
@@ -17,7 +24,8 @@ customers = {
         "current_balance": 12500.00,
         "created_date": "2024-01-15",
         "last_payment_date": None,
-        "last_payment_amount": 0.00
+        "last_payment_amount": 0.00,
+        "version": 0
     },
     "cust_002": {
         "id": "cust_002",
@@ -30,7 +38,8 @@ customers = {
         "current_balance": 8750.00,
         "created_date": "2024-02-20",
         "last_payment_date": None,
-        "last_payment_amount": 0.00
+        "last_payment_amount": 0.00,
+        "version": 0
     },
     "cust_003": {
         "id": "cust_003",
@@ -43,7 +52,8 @@ customers = {
         "current_balance": 45000.00,
         "created_date": "2023-11-10",
         "last_payment_date": None,
-        "last_payment_amount": 0.00
+        "last_payment_amount": 0.00,
+        "version": 0
     },
     'cust_004':{
         'id': 'cust_004',
@@ -56,7 +66,8 @@ customers = {
         'current_balance': 8000.0,
         'created_date': '2024-09-27',
         'last_payment_date': None,
-        'last_payment_amount': 0.0
+        'last_payment_amount': 0.0,
+        'version': 0
     },
     'cust_005': {
       'id': 'cust_005',
@@ -69,7 +80,8 @@ customers = {
         'current_balance': 12000.0,
         'created_date': '2024-07-23',
         'last_payment_date': None,
-        'last_payment_amount': 0.0
+        'last_payment_amount': 0.0,
+        'version': 0
     },
     'cust_006': {
         'id': 'cust_006',
@@ -82,7 +94,8 @@ customers = {
         'current_balance': 20000.0,
         'created_date': '2024-08-15',
         'last_payment_date': None,
-        'last_payment_amount': 0.0
+        'last_payment_amount': 0.0,
+        'version': 0
     },
     'cust_007': {
         'id': 'cust_007',
@@ -95,7 +108,8 @@ customers = {
         'current_balance': 13500.0,
         'created_date': '2023-08-29',
         'last_payment_date': None,
-        'last_payment_amount': 0.0
+        'last_payment_amount': 0.0,
+        'version': 0
     },
     'cust_008': {
         'id': 'cust_008',
@@ -108,7 +122,8 @@ customers = {
         'current_balance': 17500.0,
         'created_date': '2023-01-02',
         'last_payment_date': None,
-        'last_payment_amount': 0.0
+        'last_payment_amount': 0.0,
+        'version': 0
     },
     'cust_009': {
         'id': 'cust_009',
@@ -121,7 +136,8 @@ customers = {
         'current_balance': 12500.0,
         'created_date': '2024-11-26',
         'last_payment_date': None,
-        'last_payment_amount': 0.0
+        'last_payment_amount': 0.0,
+        'version': 0
     },
     'cust_010': {
         'id': 'cust_010',
@@ -134,7 +150,8 @@ customers = {
         'current_balance': 24000.0,
         'created_date': '2023-09-17',
         'last_payment_date': None,
-        'last_payment_amount': 0.0
+        'last_payment_amount': 0.0,
+        'version': 0
     },
     'cust_011': {
         'id': 'cust_011',
@@ -147,7 +164,8 @@ customers = {
         'current_balance': 24000.0,
         'created_date': '2024-05-26',
         'last_payment_date': None,
-        'last_payment_amount': 0.0
+        'last_payment_amount': 0.0,
+        'version': 0
     },
     'cust_012': {
         'id': 'cust_012',
@@ -160,7 +178,8 @@ customers = {
         'current_balance': 12000.0,
         'created_date': '2024-07-31',
         'last_payment_date': None,
-        'last_payment_amount': 0.0
+        'last_payment_amount': 0.0,
+        'version': 0
     },
     'cust_013': {
         'id': 'cust_013',
@@ -173,142 +192,300 @@ customers = {
         'current_balance': 20000.0,
         'created_date': '2024-01-09',
         'last_payment_date': None,
-        'last_payment_amount': 0.0
+        'last_payment_amount': 0.0,
+        'version': 0
     }
     
 }
 
-transactions = []
+# Status values are interned so filters can compare them by identity. STATUSES maps
+# each known status to its interned copy, so query input never gets interned itself.
+ACTIVE = sys.intern('active')
+SUSPENDED = sys.intern('suspended')
+STATUSES = {ACTIVE: ACTIVE, SUSPENDED: SUSPENDED}
+for c in customers.values():
+    c['status'] = STATUSES.setdefault(c['status'], sys.intern(c['status']))
 
-@app.route('/api/health', methods=['GET'])
+# Secondary index: account_number -> customer id
+account_index = {c['account_number']: cid for cid, c in customers.items()}
+
+# Lowercased (name, email) per customer, precomputed for search
+search_index = {cid: (c['name'].lower(), c['email'].lower()) for cid, c in customers.items()}
+
+def trigrams(text):
+    """Return the set of 3-character substrings of text"""
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+# Inverted index: trigram of lowercased name/email -> customer ids
+trigram_index = defaultdict(set)
+for cid, (name_lc, email_lc) in search_index.items():
+    for gram in trigrams(name_lc) | trigrams(email_lc):
+        trigram_index[gram].add(cid)
+
+def search_customer_ids(search_term):
+    """Return ids of customers whose name or email contains search_term"""
+    grams = trigrams(search_term)
+    if grams:
+        candidates = set.intersection(*(trigram_index.get(gram, set()) for gram in grams))
+    else:
+        candidates = search_index
+    
+    # Trigram hits are only candidates; confirm with a real substring check
+    return [
+        cid for cid in sorted(candidates)
+        if search_term in search_index[cid][0] or search_term in search_index[cid][1]
+    ]
+
+# Pre-encoded JSON per customer, refreshed whenever a record changes
+customer_json = {cid: orjson.dumps(c) for cid, c in customers.items()}
+
+def customer_response(customer_id: str) -> Response:
+    """Serve a customer record from its pre-encoded JSON"""
+    return Response(customer_json[customer_id], mimetype='application/json')
+
+def customer_list_response(customer_ids) -> Response:
+    """Assemble a customer listing from the pre-encoded records"""
+    body = b''.join((
+        b'{"customers":[',
+        b','.join([customer_json[cid] for cid in customer_ids]),
+        b'],"total":',
+        str(len(customer_ids)).encode(),
+        b',"timestamp":',
+        orjson.dumps(current_timestamp()),
+        b'}'
+    ))
+    return Response(body, mimetype='application/json')
+
+# Money is kept in integer cents for arithmetic and converted to dollars for output
+credit_limit_cents = {cid: to_cents(c['credit_limit']) for cid, c in customers.items()}
+balance_cents = {cid: to_cents(c['current_balance']) for cid, c in customers.items()}
+
+# Per-customer locks guarding balance read-modify-write
+balance_locks = {cid: threading.Lock() for cid in customers}
+
+# Cached ISO timestamp, reformatted at most once per millisecond
+_timestamp_cache = [0.0, '']
+
+def current_timestamp() -> str:
+    """Return the current time as an ISO string with millisecond freshness"""
+    now = time.time()
+    if now - _timestamp_cache[0] >= 0.001:
+        _timestamp_cache[1] = datetime.fromtimestamp(now).isoformat()
+        _timestamp_cache[0] = now
+    return _timestamp_cache[1]
+
+# Transaction IDs: per-process random prefix plus a monotonic counter
+TRANSACTION_ID_PREFIX = secrets.token_hex(4)
+transaction_counter = itertools.count(1)
+
+# Bounded audit log: only the most recent transactions are retained. The
+# per-customer index holds exactly the transactions still in the global log.
+TRANSACTION_LOG_LIMIT = 100_000
+transactions = deque(maxlen=TRANSACTION_LOG_LIMIT)
+transactions_by_customer = defaultdict(deque)
+
+# Transactions staged by update_balance and moved into the log in batches
+pending_transactions = deque()
+transaction_log_lock = threading.Lock()
+TRANSACTION_FLUSH_BATCH = 256
+
+def flush_transactions() -> None:
+    """Drain staged transactions into the log and the per-customer index"""
+    with transaction_log_lock:
+        while pending_transactions:
+            transaction = pending_transactions.popleft()
+            if len(transactions) == TRANSACTION_LOG_LIMIT:
+                # The oldest entry is about to fall off the log; it is also the
+                # oldest entry of its customer's index, so evict it there too
+                evicted_customer_id = transactions[0]['customer_id']
+                customer_log = transactions_by_customer[evicted_customer_id]
+                customer_log.popleft()
+                if not customer_log:
+                    del transactions_by_customer[evicted_customer_id]
+            transactions.append(transaction)
+            transactions_by_customer[transaction['customer_id']].append(transaction)
+
+HEALTH_PREFIX = b'{"status":"healthy","service":"CRM System","timestamp":"'
+HEALTH_SUFFIX = b'"}'
+
+@app.route('/api/health', methods=['GET'], provide_automatic_options=False)
 def health_check():
-    return jsonify({"status": "healthy", "service": "CRM System", "timestamp": datetime.now().isoformat()})
+    return Response(HEALTH_PREFIX + current_timestamp().encode() + HEALTH_SUFFIX, mimetype='application/json')
 
-@app.route('/api/customers', methods=['GET'])
+@app.route('/api/customers', methods=['GET'], provide_automatic_options=False)
 def get_customers():
     """Get all customers or search by query parameters"""
-    search_term = request.args.get('search', '').lower()
-    status_filter = request.args.get('status', '').lower()
-    
-    filtered_customers = list(customers.values())
+    args = request.args
+    search_term = args.get('search', '').lower()
+    status_filter = args.get('status', '').lower()
     
     if search_term:
-        filtered_customers = [
-            c for c in filtered_customers 
-            if search_term in c['name'].lower() or search_term in c['email'].lower()
-        ]
+        customer_ids = search_customer_ids(search_term)
+    else:
+        customer_ids = list(customers)
     
     if status_filter:
-        filtered_customers = [c for c in filtered_customers if c['status'] == status_filter]
+        status = STATUSES.get(status_filter)
+        if status is None:
+            return customer_list_response([])
+        customer_ids = [cid for cid in customer_ids if customers[cid]['status'] is status]
     
-    return jsonify({
-        "customers": filtered_customers,
-        "total": len(filtered_customers),
-        "timestamp": datetime.now().isoformat()
-    })
+    return customer_list_response(customer_ids)
 
-@app.route('/api/customers/<customer_id>', methods=['GET'])
-def get_customer(customer_id):
+@app.route('/api/customers/<customer_id>', methods=['GET'], provide_automatic_options=False)
+def get_customer(customer_id: str):
     """Get customer by ID"""
-    customer = customers.get(customer_id)
-    if not customer:
+    if customer_id not in customers:
         return jsonify({"error": "Customer not found"}), 404
     
-    return jsonify(customer)
+    return customer_response(customer_id)
 
-@app.route('/api/customers/by-account/<account_number>', methods=['GET'])
-def get_customer_by_account(account_number):
+@app.route('/api/customers/by-account/<account_number>', methods=['GET'], provide_automatic_options=False)
+def get_customer_by_account(account_number: str):
     """Get customer by account number"""
-    for customer in customers.values():
-        if customer['account_number'] == account_number:
-            return jsonify(customer)
+    customer_id: str | None = account_index.get(account_number)
+    if not customer_id:
+        return jsonify({"error": "Customer not found"}), 404
     
-    return jsonify({"error": "Customer not found"}), 404
+    return customer_response(customer_id)
 
-@app.route('/api/customers/<customer_id>/credit-check', methods=['GET'])
-def credit_check(customer_id):
+@app.route('/api/customers/<customer_id>/credit-check', methods=['GET'], provide_automatic_options=False)
+def credit_check(customer_id: str):
     """Check if customer has sufficient credit for a transaction"""
-    customer = customers.get(customer_id)
+    customer: dict | None = customers.get(customer_id)
     if not customer:
         return jsonify({"error": "Customer not found"}), 404
     
-    amount = float(request.args.get('amount', 0))
-    available_credit = customer['credit_limit'] - customer['current_balance']
+    amount_c: int = to_cents(request.args.get('amount', 0))
+    available_c: int = credit_limit_cents[customer_id] - balance_cents[customer_id]
     
     return jsonify({
         "customer_id": customer_id,
         "credit_limit": customer['credit_limit'],
         "current_balance": customer['current_balance'],
-        "available_credit": available_credit,
-        "requested_amount": amount,
-        "approved": amount <= available_credit and customer['status'] == 'active',
+        "available_credit": available_c / 100,
+        "requested_amount": amount_c / 100,
+        "approved": amount_c <= available_c and customer['status'] is ACTIVE,
         "status": customer['status']
     })
 
-@app.route('/api/customers/<customer_id>/update-balance', methods=['POST'])
+@app.route('/api/customers/bulk-credit-check', methods=['GET'], provide_automatic_options=False)
+def bulk_credit_check():
+    """Check available credit for every customer in a single pass"""
+    amount_c = to_cents(request.args.get('amount', 0))
+    
+    results = []
+    approved_count = 0
+    for cid, c in customers.items():
+        available_c = credit_limit_cents[cid] - balance_cents[cid]
+        approved = amount_c <= available_c and c['status'] is ACTIVE
+        approved_count += approved
+        results.append({
+            "customer_id": cid,
+            "available_credit": available_c / 100,
+            "approved": approved
+        })
+    
+    return jsonify({
+        "requested_amount": amount_c / 100,
+        "results": results,
+        "approved_count": approved_count,
+        "total": len(results)
+    })
+
+@app.route('/api/customers/<customer_id>/update-balance', methods=['POST'], provide_automatic_options=False)
 def update_balance(customer_id):
     """Update customer balance with payment processing"""
     customer = customers.get(customer_id)
     if not customer:
         return jsonify({"error": "Customer not found"}), 404
     
-    data = request.get_json()
-    amount = data.get('amount', 0)
+    data = request.get_json(silent=True, cache=False)
+    if data is None:
+        return jsonify({"error": "Request body must be valid JSON"}), 400
+    
+    amount_c = to_cents(data.get('amount', 0))
+    amount = amount_c / 100
     transaction_type = data.get('type', 'payment')  # payment, charge, adjustment
     reference = data.get('reference', '')
     bank_transaction_id = data.get('bank_transaction_id', '')
     
-    old_balance = customers[customer_id]['current_balance']
+    if_match = request.headers.get('If-Match')
     
-    if transaction_type == 'payment':
-        customers[customer_id]['current_balance'] -= amount
-        customers[customer_id]['last_payment_date'] = datetime.now().isoformat()
-        customers[customer_id]['last_payment_amount'] = amount
-    elif transaction_type == 'charge':
-        customers[customer_id]['current_balance'] += amount
-    elif transaction_type == 'adjustment':
-        customers[customer_id]['current_balance'] += amount  # Can be negative for credits
-    
-    # Ensure balance doesn't go negative beyond credit limit
-    if customers[customer_id]['current_balance'] < 0:
-        available_credit = customers[customer_id]['credit_limit']
-        if abs(customers[customer_id]['current_balance']) > available_credit:
+    with balance_locks[customer_id]:
+        expected_version = customer['version']
+        # "If-Match: *" matches any current version of the record
+        if if_match is not None and if_match.strip() != '*' and if_match.strip('"') != str(expected_version):
+            return jsonify({
+                "error": "Customer record has been modified",
+                "current_version": expected_version
+            }), 409
+        
+        old_balance_c = balance_cents[customer_id]
+        
+        if transaction_type == 'payment':
+            delta_c = -amount_c
+        elif transaction_type in ('charge', 'adjustment'):
+            delta_c = amount_c  # Adjustments can be negative for credits
+        else:
+            delta_c = 0
+        new_balance_c = old_balance_c + delta_c
+        
+        # Ensure balance doesn't go negative beyond credit limit
+        if -new_balance_c > credit_limit_cents[customer_id]:
             return jsonify({
                 "error": "Payment would exceed credit limit",
-                "available_credit": available_credit,
-                "attempted_balance": customers[customer_id]['current_balance']
+                "available_credit": credit_limit_cents[customer_id] / 100,
+                "attempted_balance": new_balance_c / 100
             }), 400
+        
+        balance_cents[customer_id] = new_balance_c
+        customer['current_balance'] = new_balance_c / 100
+        if transaction_type == 'payment':
+            customer['last_payment_date'] = datetime.now().isoformat()
+            customer['last_payment_amount'] = amount
+        customer['version'] = expected_version + 1
+        customer_json[customer_id] = orjson.dumps(customer)
+        
+        # Record transaction with more details
+        transaction = {
+            "id": f"tx-{TRANSACTION_ID_PREFIX}-{next(transaction_counter):012d}",
+            "customer_id": customer_id,
+            "amount": amount,
+            "type": transaction_type,
+            "reference": reference,
+            "bank_transaction_id": bank_transaction_id,
+            "timestamp": current_timestamp(),
+            "old_balance": old_balance_c / 100,
+            "new_balance": new_balance_c / 100,
+            "processed_by": "system"
+        }
+        pending_transactions.append(transaction)
+        
+        response = jsonify({
+            "transaction": transaction,
+            "customer": customer,
+            "balance_change": delta_c / 100
+        })
     
-    # Record transaction with more details
-    transaction = {
-        "id": str(uuid.uuid4()),
-        "customer_id": customer_id,
-        "amount": amount,
-        "type": transaction_type,
-        "reference": reference,
-        "bank_transaction_id": bank_transaction_id,
-        "timestamp": datetime.now().isoformat(),
-        "old_balance": old_balance,
-        "new_balance": customers[customer_id]['current_balance'],
-        "processed_by": "system"
-    }
-    transactions.append(transaction)
+    if len(pending_transactions) >= TRANSACTION_FLUSH_BATCH:
+        flush_transactions()
     
-    return jsonify({
-        "transaction": transaction,
-        "customer": customers[customer_id],
-        "balance_change": amount if transaction_type == 'charge' else -amount
-    })
+    return response
 
-@app.route('/api/transactions', methods=['GET'])
+@app.route('/api/transactions', methods=['GET'], provide_automatic_options=False)
 def get_transactions():
     """Get all transactions"""
+    flush_transactions()
     customer_id = request.args.get('customer_id')
-    if customer_id:
-        filtered_transactions = [t for t in transactions if t['customer_id'] == customer_id]
-        return jsonify({"transactions": filtered_transactions})
+    # Snapshot under the lock so a concurrent flush cannot mutate the deques mid-copy
+    with transaction_log_lock:
+        if customer_id:
+            snapshot = list(transactions_by_customer.get(customer_id, ()))
+        else:
+            snapshot = list(transactions)
     
-    return jsonify({"transactions": transactions})
+    return jsonify({"transactions": snapshot})
 
 if __name__ == '__main__':
     print("Starting CRM System on port 5001...")
@@ -318,6 +495,7 @@ if __name__ == '__main__':
     print("- GET /api/customers/<id> - Get customer by ID")
     print("- GET /api/customers/by-account/<account_number> - Get customer by account number")
     print("- GET /api/customers/<id>/credit-check?amount=X - Check credit availability")
+    print("- GET /api/customers/bulk-credit-check?amount=X - Check credit availability for all customers")
     print("- POST /api/customers/<id>/update-balance - Update customer balance")
     print("- GET /api/transactions - Get all transactions (supports ?customer_id= filter)")
-    app.run(debug=True, port=5001)
\ No newline at end of file
+    run_app(app, 5001, threaded=True)
\ No newline at end of file
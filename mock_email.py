@@ -1,13 +1,27 @@
-from flask import Flask, jsonify, request
+from flask import Response, g, jsonify, request
 from datetime import datetime
-import uuid
+from collections import Counter, namedtuple
+from types import MappingProxyType
+import threading
+import time
 import json
+import string
+from service_utils import create_app, new_id, run_app, stream_listing
 
-app = Flask(__name__)
+app = create_app(__name__)
 
 # Mock email storage
 sent_emails = []
-email_templates = {
+sent_emails_by_id = {}
+sent_emails_unread = {}  # id -> email, in send order
+sent_emails_by_category = {}
+sent_emails_by_priority = {}
+
+# Running aggregates for /api/statistics, maintained as emails are stored
+category_counts = Counter()
+priority_counts = Counter()
+email_store_lock = threading.Lock()
+email_templates = MappingProxyType({
     "payment_mismatch": {
         "subject": "Payment Processing Alert - Transaction Mismatch",
         "template": """
@@ -143,34 +157,126 @@ Best regards,
 Payment Processing System
         """
     }
+})
+
+# Template summaries served by /api/templates, built once since templates never change
+template_info = {
+    name: {
+        "subject": template['subject'],
+        "description": f"Template for {name.replace('_', ' ')} notifications"
+    }
+    for name, template in email_templates.items()
 }
 
+_formatter = string.Formatter()
+
+def compile_template(text):
+    """Parse a str.format template once into (literal, field_name, conversion, format_spec) parts"""
+    return tuple(
+        (literal, field, conversion, compile_template(spec) if spec and '{' in spec else spec)
+        for literal, field, spec, conversion in _formatter.parse(text)
+    )
+
+def render_template(parts, data):
+    """Render precompiled template parts exactly as text.format(**data); raises KeyError for missing fields"""
+    rendered = []
+    for literal, field, conversion, spec in parts:
+        rendered.append(literal)
+        if field is not None:
+            value = _formatter.convert_field(_formatter.get_field(field, (), data)[0], conversion)
+            if not isinstance(spec, str):
+                spec = render_template(spec, data)  # nested fields inside the format spec
+            rendered.append(format(value, spec))
+    return ''.join(rendered)
+
+# Templates parsed once at import instead of on every send
+compiled_templates = {
+    name: (compile_template(t['subject']), compile_template(t['template']))
+    for name, t in email_templates.items()
+}
+
+def store_email(email_data):
+    """Record a sent email and update the indexes and running statistics"""
+    store_emails((email_data,))
+
+def store_emails(batch):
+    """Record a batch of sent emails under a single acquisition of the store lock"""
+    with email_store_lock:
+        sent_emails.extend(batch)
+        for email_data in batch:
+            sent_emails_by_id[email_data["id"]] = email_data
+            sent_emails_unread[email_data["id"]] = email_data
+            sent_emails_by_category.setdefault(email_data["category"], []).append(email_data)
+            sent_emails_by_priority.setdefault(email_data["priority"], []).append(email_data)
+            category_counts[email_data["category"]] += 1
+            priority_counts[email_data["priority"]] += 1
+
+def build_email(data, now_iso, now_ns):
+    """Build a sent email record from a send-email request payload"""
+    dg = data.get
+    return {
+        "id": new_id("em"),
+        "to": dg('to', 'finance@company.com'),
+        "cc": dg('cc', []),
+        "subject": dg('subject', 'Payment Processing Notification'),
+        "body": dg('body', ''),
+        "priority": dg('priority', 'normal'),  # low, normal, high, urgent
+        "category": dg('category', 'general'),  # payment_mismatch, overpayment, etc.
+        "timestamp": now_iso,
+        "timestamp_ns": now_ns,
+        "status": "sent",
+        "read": False,
+        "metadata": dg('metadata', {})
+    }
+
 notification_rules = []
 
+# Built-in notification checks evaluated by /api/evaluate-notification, in order.
+# Each predicate receives (amount, customer_status, customer_known, validation_status, notes).
+NotificationCheck = namedtuple('NotificationCheck', ['applies', 'template', 'priority', 'reason'])
+
+NOTIFICATION_CHECKS = (
+    NotificationCheck(
+        lambda amount, status, known, validation_status, notes: amount > 50000,
+        "high_value_alert", "high", "Transaction amount ${amount} exceeds threshold"
+    ),
+    NotificationCheck(
+        lambda amount, status, known, validation_status, notes: status == 'suspended',
+        "suspended_customer_payment", "high", "Payment from suspended customer account"
+    ),
+    NotificationCheck(
+        lambda amount, status, known, validation_status, notes: not known,
+        "unknown_customer", "urgent", "Payment from unknown customer account"
+    ),
+    NotificationCheck(
+        lambda amount, status, known, validation_status, notes: validation_status in ('warning', 'attention_required'),
+        "payment_mismatch", "normal", "Payment validation issues detected"
+    ),
+    NotificationCheck(
+        lambda amount, status, known, validation_status, notes: 'overpayment' in notes,
+        "overpayment_alert", "normal", "Customer overpayment detected"
+    ),
+)
+
+def request_timestamp():
+    """Return the (ISO string, nanoseconds) timestamp of the current request, taken on first use"""
+    stamp = g.get('timestamp')
+    if stamp is None:
+        now_ns = time.time_ns()
+        stamp = g.timestamp = (datetime.fromtimestamp(now_ns / 1e9).isoformat(), now_ns)
+    return stamp
+
 @app.route('/api/health', methods=['GET'])
 def health_check():
-    return jsonify({"status": "healthy", "service": "Email Notification System", "timestamp": datetime.now().isoformat()})
+    return jsonify({"status": "healthy", "service": "Email Notification System", "timestamp": request_timestamp()[0]})
 
 @app.route('/api/send-email', methods=['POST'])
 def send_email():
     """Send an email notification"""
     data = request.get_json()
     
-    email_data = {
-        "id": str(uuid.uuid4()),
-        "to": data.get('to', 'finance@company.com'),
-        "cc": data.get('cc', []),
-        "subject": data.get('subject', 'Payment Processing Notification'),
-        "body": data.get('body', ''),
-        "priority": data.get('priority', 'normal'),  # low, normal, high, urgent
-        "category": data.get('category', 'general'),  # payment_mismatch, overpayment, etc.
-        "timestamp": datetime.now().isoformat(),
-        "status": "sent",
-        "read": False,
-        "metadata": data.get('metadata', {})
-    }
-    
-    sent_emails.append(email_data)
+    email_data = build_email(data, *request_timestamp())
+    store_email(email_data)
     
     return jsonify({
         "message": "Email sent successfully",
@@ -178,41 +284,61 @@ def send_email():
         "timestamp": email_data["timestamp"]
     })
 
+@app.route('/api/send-emails', methods=['POST'])
+def send_emails():
+    """Send a batch of email notifications in one request"""
+    items = request.get_json()
+    if not isinstance(items, list) or not all(isinstance(data, dict) for data in items):
+        return jsonify({"error": "Expected a JSON list of email objects"}), 400
+    
+    now_iso, now_ns = request_timestamp()
+    batch = [build_email(data, now_iso, now_ns) for data in items]
+    store_emails(batch)
+    
+    return jsonify({
+        "message": f"{len(batch)} emails sent successfully",
+        "email_ids": [email_data["id"] for email_data in batch],
+        "timestamp": now_iso
+    })
+
 @app.route('/api/send-template-email', methods=['POST'])
 def send_template_email():
     """Send an email using a predefined template"""
     data = request.get_json()
-    template_name = data.get('template', '')
-    template_data = data.get('data', {})
+    dg = data.get
+    template_name = dg('template', '')
+    template_data = dg('data', {})
     
     if template_name not in email_templates:
         return jsonify({"error": f"Template '{template_name}' not found"}), 400
     
-    template = email_templates[template_name]
+    subject_parts, body_parts = compiled_templates[template_name]
     
     # Format the template with provided data
     try:
-        formatted_subject = template['subject'].format(**template_data)
-        formatted_body = template['template'].format(**template_data)
+        formatted_subject = render_template(subject_parts, template_data)
+        formatted_body = render_template(body_parts, template_data)
     except KeyError as e:
         return jsonify({"error": f"Missing template data: {str(e)}"}), 400
     
+    now_iso, now_ns = request_timestamp()
     email_data = {
-        "id": str(uuid.uuid4()),
-        "to": data.get('to', 'finance@company.com'),
-        "cc": data.get('cc', []),
+        "id": new_id("em"),
+        "to": dg('to', 'finance@company.com'),
+        "cc": dg('cc', []),
         "subject": formatted_subject,
         "body": formatted_body,
-        "priority": data.get('priority', 'normal'),
+        "priority": dg('priority', 'normal'),
         "category": template_name,
         "template_used": template_name,
-        "timestamp": datetime.now().isoformat(),
+        "timestamp": now_iso,
+        "timestamp_ns": now_ns,
         "status": "sent",
         "read": False,
         "metadata": template_data
     }
     
-    sent_emails.append(email_data)
+    store_email(email_data)
     
     return jsonify({
         "message": "Template email sent successfully",
@@ -228,30 +354,40 @@ def get_emails():
     priority = request.args.get('priority', '')
     unread_only = request.args.get('unread', '').lower() == 'true'
     
-    filtered_emails = sent_emails.copy()
-    
-    if category:
-        filtered_emails = [e for e in filtered_emails if e.get('category', '') == category]
-    
-    if priority:
-        filtered_emails = [e for e in filtered_emails if e.get('priority', '') == priority]
-    
-    if unread_only:
-        filtered_emails = [e for e in filtered_emails if not e.get('read', False)]
-    
-    # Sort by timestamp, most recent first
-    filtered_emails.sort(key=lambda x: x['timestamp'], reverse=True)
-    
-    return jsonify({
-        "emails": filtered_emails,
-        "total": len(filtered_emails),
-        "unread_count": len([e for e in sent_emails if not e.get('read', False)])
-    })
+    # Start from the smallest matching index, walking it newest first, and
+    # build exactly one list for the response
+    if category and priority:
+        by_category = sent_emails_by_category.get(category, [])
+        by_priority = sent_emails_by_priority.get(priority, [])
+        if len(by_priority) < len(by_category):
+            filtered_emails = [e for e in reversed(by_priority) if e['category'] == category]
+        else:
+            filtered_emails = [e for e in reversed(by_category) if e['priority'] == priority]
+    elif category:
+        filtered_emails = sent_emails_by_category.get(category, [])[::-1]
+    elif priority:
+        filtered_emails = sent_emails_by_priority.get(priority, [])[::-1]
+    elif unread_only:
+        # The unread dict changes size under the lock, so snapshot it under the lock too
+        with email_store_lock:
+            filtered_emails = list(reversed(sent_emails_unread.values()))
+    else:
+        filtered_emails = sent_emails[::-1]
+    
+    if unread_only and (category or priority):
+        filtered_emails = [e for e in filtered_emails if not e['read']]
+    
+    # Stream the listing so the full JSON document is never held in memory
+    return Response(stream_listing(
+        "emails", filtered_emails,
+        total=len(filtered_emails),
+        unread_count=len(sent_emails_unread)
+    ), mimetype='application/json')
 
 @app.route('/api/emails/<email_id>', methods=['GET'])
 def get_email(email_id):
     """Get specific email by ID"""
-    email = next((e for e in sent_emails if e['id'] == email_id), None)
+    email = sent_emails_by_id.get(email_id)
     if not email:
         return jsonify({"error": "Email not found"}), 404
     
@@ -260,12 +396,15 @@ def get_email(email_id):
 @app.route('/api/emails/<email_id>/mark-read', methods=['POST'])
 def mark_email_read(email_id):
     """Mark an email as read"""
-    email = next((e for e in sent_emails if e['id'] == email_id), None)
+    email = sent_emails_by_id.get(email_id)
     if not email:
         return jsonify({"error": "Email not found"}), 404
     
-    email['read'] = True
-    email['read_timestamp'] = datetime.now().isoformat()
+    read_timestamp = request_timestamp()[0]
+    with email_store_lock:
+        sent_emails_unread.pop(email_id, None)
+        email['read'] = True
+        email['read_timestamp'] = read_timestamp
     
     return jsonify({"message": "Email marked as read", "email_id": email_id})
 
@@ -278,16 +417,17 @@ def get_notification_rules():
 def create_notification_rule():
     """Create a new notification rule"""
     data = request.get_json()
+    dg = data.get
     
     rule = {
-        "id": str(uuid.uuid4()),
-        "name": data.get('name', ''),
-        "condition": data.get('condition', {}),  # e.g., {"amount_threshold": 10000, "customer_status": "suspended"}
-        "template": data.get('template', 'payment_mismatch'),
-        "recipients": data.get('recipients', ['finance@company.com']),
-        "priority": data.get('priority', 'normal'),
-        "active": data.get('active', True),
-        "created_date": datetime.now().isoformat()
+        "id": new_id("rule"),
+        "name": dg('name', ''),
+        "condition": dg('condition', {}),  # e.g., {"amount_threshold": 10000, "customer_status": "suspended"}
+        "template": dg('template', 'payment_mismatch'),
+        "recipients": dg('recipients', ['finance@company.com']),
+        "priority": dg('priority', 'normal'),
+        "active": dg('active', True),
+        "created_date": request_timestamp()[0]
     }
     
     notification_rules.append(rule)
@@ -301,99 +441,58 @@ def create_notification_rule():
 def evaluate_notification():
     """Evaluate if a transaction should trigger notifications"""
     data = request.get_json()
+    dg = data.get
     
-    transaction = data.get('transaction', {})
-    customer = data.get('customer', {})
-    validation_result = data.get('validation_result', {})
+    # Treat missing or null sections as empty
+    transaction = dg('transaction') or {}
+    customer = dg('customer') or {}
+    validation_result = dg('validation_result') or {}
     
-    notifications_to_send = []
-    
-    # Check various conditions
+    # Pull every field the checks need once
+    customer_get = customer.get
+    validation_get = validation_result.get
     amount = transaction.get('amount', 0)
-    customer_status = customer.get('status', 'unknown')
-    account_number = transaction.get('account_number', '')
-    
-    # High value transaction
-    if amount > 50000:
-        notifications_to_send.append({
-            "template": "high_value_alert",
-            "priority": "high",
-            "reason": f"Transaction amount ${amount} exceeds threshold"
-        })
-    
-    # Suspended customer
-    if customer_status == 'suspended':
-        notifications_to_send.append({
-            "template": "suspended_customer_payment",
-            "priority": "high",
-            "reason": "Payment from suspended customer account"
-        })
-    
-    # Unknown customer
-    if not customer:
-        notifications_to_send.append({
-            "template": "unknown_customer",
-            "priority": "urgent",
-            "reason": "Payment from unknown customer account"
-        })
-    
-    # Validation issues
-    if validation_result and validation_result.get('validation_status') in ['warning', 'attention_required']:
-        notifications_to_send.append({
-            "template": "payment_mismatch",
-            "priority": "normal",
-            "reason": "Payment validation issues detected"
-        })
-    
-    # Overpayment detection
-    if validation_result and 'overpayment' in validation_result.get('notes', []):
-        notifications_to_send.append({
-            "template": "overpayment_alert",
-            "priority": "normal",
-            "reason": "Customer overpayment detected"
-        })
+    customer_status = customer_get('status', 'unknown')
+    customer_known = bool(customer_get('id'))
+    validation_status = validation_get('validation_status')
+    notes = set(validation_get('notes') or ())
+    
+    notifications_to_send = [
+        {
+            "template": check.template,
+            "priority": check.priority,
+            "reason": check.reason.format(amount=amount)
+        }
+        for check in NOTIFICATION_CHECKS
+        if check.applies(amount, customer_status, customer_known, validation_status, notes)
+    ]
     
     return jsonify({
         "should_notify": len(notifications_to_send) > 0,
         "notifications": notifications_to_send,
-        "evaluation_timestamp": datetime.now().isoformat()
+        "evaluation_timestamp": request_timestamp()[0]
     })
 
 @app.route('/api/templates', methods=['GET'])
 def get_templates():
     """Get all available email templates"""
-    template_info = {}
-    for name, template in email_templates.items():
-        template_info[name] = {
-            "subject": template['subject'],
-            "description": f"Template for {name.replace('_', ' ')} notifications"
-        }
-    
     return jsonify({"templates": template_info})
 
 @app.route('/api/statistics', methods=['GET'])
 def get_statistics():
     """Get email statistics"""
-    total_emails = len(sent_emails)
-    unread_emails = len([e for e in sent_emails if not e.get('read', False)])
-    
-    # Count by category
-    category_counts = {}
-    priority_counts = {}
-    
-    for email in sent_emails:
-        category = email.get('category', 'general')
-        priority = email.get('priority', 'normal')
-        
-        category_counts[category] = category_counts.get(category, 0) + 1
-        priority_counts[priority] = priority_counts.get(priority, 0) + 1
+    with email_store_lock:
+        total_emails = len(sent_emails)
+        unread_emails = len(sent_emails_unread)
+        categories = dict(category_counts)
+        priorities = dict(priority_counts)
     
     return jsonify({
         "total_emails": total_emails,
         "unread_emails": unread_emails,
-        "categories": category_counts,
-        "priorities": priority_counts,
-        "timestamp": datetime.now().isoformat()
+        "categories": categories,
+        "priorities": priorities,
+        "timestamp": request_timestamp()[0]
     })
 
 if __name__ == '__main__':
@@ -401,6 +500,7 @@ if __name__ == '__main__':
     print("Available endpoints:")
     print("- GET /api/health - Health check")
     print("- POST /api/send-email - Send custom email")
+    print("- POST /api/send-emails - Send a batch of custom emails")
     print("- POST /api/send-template-email - Send email using template")
     print("- GET /api/emails - Get all emails (supports filtering)")
     print("- GET /api/emails/<id> - Get specific email")
@@ -410,4 +510,4 @@ if __name__ == '__main__':
     print("- GET /api/statistics - Get email statistics")
     print("- GET /api/notification-rules - Get notification rules")
     print("- POST /api/notification-rules - Create notification rule")
-    app.run(debug=True, port=5003)
\ No newline at end of file
+    run_app(app, 5003)
\ No newline at end of file
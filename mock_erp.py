@@ -1,8 +1,11 @@
-from flask import Flask, jsonify, request
+from flask import Response, jsonify, request
 from datetime import datetime, timedelta
-import uuid
+from collections import defaultdict
+from array import array
+import threading
+from service_utils import create_app, new_id, run_app, stream_listing, to_cents
 
-app = Flask(__name__)
+app = create_app(__name__)
 
 # Mock ERP database
 invoices = {
@@ -243,7 +246,82 @@ purchase_orders = {
     }
 }
 
-payments = []
+# Payments are append-only and stored column-wise: one list per field, with
+# amounts packed into float arrays. Row i of every column is the i-th payment.
+payment_columns = {
+    "id": [],
+    "invoice_id": [],
+    "customer_account": [],
+    "amount": array('d'),
+    "method": [],
+    "reference": [],
+    "bank_transaction_id": [],
+    "timestamp": [],
+    "status": [],
+    "processed_by": [],
+    "outstanding_before": array('d'),
+    "outstanding_after": array('d')
+}
+payment_rows_by_invoice = defaultdict(list)
+payments_lock = threading.Lock()
+
+# Per-invoice locks guarding the paid_amount read-check-write in process_payment
+invoice_payment_locks = {invoice_id: threading.Lock() for invoice_id in invoices}
+
+# Secondary index: customer account -> invoice ids
+invoices_by_account = defaultdict(list)
+for invoice in invoices.values():
+    invoices_by_account[invoice['customer_account']].append(invoice['id'])
+
+# Outstanding (pending or overdue) invoice total per customer account, in integer cents
+OUTSTANDING_STATUSES = ('pending', 'overdue')
+outstanding_by_account = defaultdict(int)
+for invoice in invoices.values():
+    if invoice['status'] in OUTSTANDING_STATUSES:
+        outstanding_by_account[invoice['customer_account']] += to_cents(invoice['amount'])
+
+# Per-status invoice aggregates, kept in step with invoice status changes. Totals
+# are integer cents so repeated status moves cannot accumulate float drift.
+invoice_totals_by_status = defaultdict(int)
+invoices_by_status = defaultdict(set)
+for invoice in invoices.values():
+    invoice_totals_by_status[invoice['status']] += to_cents(invoice['amount'])
+    invoices_by_status[invoice['status']].add(invoice['id'])
+invoice_status_lock = threading.Lock()
+
+# Purchase orders are never modified at runtime, so their totals are fixed
+po_totals_by_status = defaultdict(int)  # cents
+for po in purchase_orders.values():
+    po_totals_by_status[po['status']] += to_cents(po['amount'])
+
+def record_payment(payment):
+    """Append a payment to the column store and index its row by invoice"""
+    with payments_lock:
+        row = len(payment_columns["id"])
+        for field, column in payment_columns.items():
+            column.append(payment[field])
+        payment_rows_by_invoice[payment["invoice_id"]].append(row)
+
+def payment_row(row):
+    """Rebuild the payment record stored at the given row"""
+    return {field: column[row] for field, column in payment_columns.items()}
+
+def set_invoice_status(invoice, status):
+    """Change an invoice's status and move it between the status aggregates"""
+    with invoice_status_lock:
+        old_status = invoice['status']
+        amount_c = to_cents(invoice['amount'])
+        invoice_totals_by_status[old_status] -= amount_c
+        invoices_by_status[old_status].discard(invoice['id'])
+        invoice['status'] = status
+        invoice_totals_by_status[status] += amount_c
+        invoices_by_status[status].add(invoice['id'])
+        
+        was_outstanding = old_status in OUTSTANDING_STATUSES
+        is_outstanding = status in OUTSTANDING_STATUSES
+        if was_outstanding != is_outstanding:
+            delta = amount_c if is_outstanding else -amount_c
+            outstanding_by_account[invoice['customer_account']] += delta
 
 @app.route('/api/health', methods=['GET'])
 def health_check():
@@ -255,19 +333,19 @@ def get_invoices():
     status_filter = request.args.get('status', '').lower()
     customer_account = request.args.get('customer_account', '')
     
-    filtered_invoices = list(invoices.values())
+    if customer_account:
+        filtered_invoices = [invoices[i] for i in invoices_by_account.get(customer_account, ())]
+    else:
+        filtered_invoices = list(invoices.values())
     
     if status_filter:
         filtered_invoices = [i for i in filtered_invoices if i['status'] == status_filter]
     
-    if customer_account:
-        filtered_invoices = [i for i in filtered_invoices if i['customer_account'] == customer_account]
-    
-    return jsonify({
-        "invoices": filtered_invoices,
-        "total": len(filtered_invoices),
-        "timestamp": datetime.now().isoformat()
-    })
+    return Response(stream_listing(
+        "invoices", filtered_invoices,
+        total=len(filtered_invoices),
+        timestamp=datetime.now().isoformat()
+    ), mimetype='application/json')
 
 @app.route('/api/invoices/<invoice_id>', methods=['GET'])
 def get_invoice(invoice_id):
@@ -281,7 +359,7 @@ def get_invoice(invoice_id):
 @app.route('/api/invoices/by-account/<account_number>', methods=['GET'])
 def get_invoices_by_account(account_number):
     """Get invoices by customer account number"""
-    account_invoices = [i for i in invoices.values() if i['customer_account'] == account_number]
+    account_invoices = [invoices[i] for i in invoices_by_account.get(account_number, ())]
     
     return jsonify({
         "invoices": account_invoices,
@@ -302,55 +380,55 @@ def process_payment(invoice_id):
     reference = data.get('reference', '')
     bank_transaction_id = data.get('bank_transaction_id', '')
     
-    # Get current outstanding amount
-    paid_amount = sum(p['amount'] for p in payments if p['invoice_id'] == invoice_id)
-    outstanding_amount = invoice['amount'] - paid_amount
-    
-    if payment_amount > outstanding_amount:
+    with invoice_payment_locks[invoice_id]:
+        # Get current outstanding amount
+        paid_amount = invoice.get('paid_amount', 0.0)
+        outstanding_amount = invoice['amount'] - paid_amount
+        
+        if payment_amount > outstanding_amount:
+            return jsonify({
+                "error": "Payment amount exceeds outstanding balance",
+                "outstanding_amount": outstanding_amount,
+                "payment_amount": payment_amount,
+                "overpayment": payment_amount - outstanding_amount
+            }), 400
+        
+        # Create payment record with enhanced tracking
+        payment = {
+            "id": new_id("pay"),
+            "invoice_id": invoice_id,
+            "customer_account": invoice['customer_account'],
+            "amount": payment_amount,
+            "method": payment_method,
+            "reference": reference,
+            "bank_transaction_id": bank_transaction_id,
+            "timestamp": datetime.now().isoformat(),
+            "status": "completed",
+            "processed_by": "system",
+            "outstanding_before": outstanding_amount,
+            "outstanding_after": outstanding_amount - payment_amount
+        }
+        record_payment(payment)
+        
+        # Update invoice status based on payment
+        new_outstanding = outstanding_amount - payment_amount
+        invoice['paid_amount'] = paid_amount + payment_amount
+        if new_outstanding <= 0.01:  # Account for floating point precision
+            set_invoice_status(invoice, 'paid')
+            invoice['paid_date'] = datetime.now().isoformat()
+        else:
+            set_invoice_status(invoice, 'partially_paid')
+        
+        # Update last payment info
+        invoices[invoice_id]['last_payment_date'] = datetime.now().isoformat()
+        invoices[invoice_id]['last_payment_amount'] = payment_amount
+        
         return jsonify({
-            "error": "Payment amount exceeds outstanding balance",
-            "outstanding_amount": outstanding_amount,
-            "payment_amount": payment_amount,
-            "overpayment": payment_amount - outstanding_amount
-        }), 400
-    
-    # Create payment record with enhanced tracking
-    payment = {
-        "id": str(uuid.uuid4()),
-        "invoice_id": invoice_id,
-        "customer_account": invoice['customer_account'],
-        "amount": payment_amount,
-        "method": payment_method,
-        "reference": reference,
-        "bank_transaction_id": bank_transaction_id,
-        "timestamp": datetime.now().isoformat(),
-        "status": "completed",
-        "processed_by": "system",
-        "outstanding_before": outstanding_amount,
-        "outstanding_after": outstanding_amount - payment_amount
-    }
-    payments.append(payment)
-    
-    # Update invoice status based on payment
-    new_outstanding = outstanding_amount - payment_amount
-    if new_outstanding <= 0.01:  # Account for floating point precision
-        invoices[invoice_id]['status'] = 'paid'
-        invoices[invoice_id]['paid_date'] = datetime.now().isoformat()
-        invoices[invoice_id]['paid_amount'] = invoice['amount']
-    else:
-        invoices[invoice_id]['status'] = 'partially_paid'
-        invoices[invoice_id]['paid_amount'] = invoice['amount'] - new_outstanding
-    
-    # Update last payment info
-    invoices[invoice_id]['last_payment_date'] = datetime.now().isoformat()
-    invoices[invoice_id]['last_payment_amount'] = payment_amount
-    
-    return jsonify({
-        "payment": payment,
-        "invoice": invoices[invoice_id],
-        "message": f"Payment of ${payment_amount} processed successfully",
-        "remaining_balance": new_outstanding
-    })
+            "payment": payment,
+            "invoice": invoices[invoice_id],
+            "message": f"Payment of ${payment_amount} processed successfully",
+            "remaining_balance": new_outstanding
+        })
 
 @app.route('/api/purchase-orders', methods=['GET'])
 def get_purchase_orders():
@@ -380,19 +458,19 @@ def get_purchase_order(po_id):
 @app.route('/api/cash-flow/analysis', methods=['GET'])
 def cash_flow_analysis():
     """Get cash flow analysis"""
-    # Calculate totals
-    pending_receivables = sum(i['amount'] for i in invoices.values() if i['status'] in ['pending', 'overdue'])
-    total_payables = sum(po['amount'] for po in purchase_orders.values() if po['status'] == 'approved')
-    
-    overdue_invoices = [i for i in invoices.values() if i['status'] == 'overdue']
-    overdue_amount = sum(i['amount'] for i in overdue_invoices)
+    # Read totals from the maintained aggregates, all in cents
+    with invoice_status_lock:
+        pending_receivables_c = invoice_totals_by_status['pending'] + invoice_totals_by_status['overdue']
+        overdue_amount_c = invoice_totals_by_status['overdue']
+        overdue_invoices = [invoices[i] for i in sorted(invoices_by_status['overdue'])]
+    total_payables_c = po_totals_by_status['approved']
     
     return jsonify({
         "summary": {
-            "pending_receivables": pending_receivables,
-            "total_payables": total_payables,
-            "net_cash_flow": pending_receivables - total_payables,
-            "overdue_amount": overdue_amount,
+            "pending_receivables": pending_receivables_c / 100,
+            "total_payables": total_payables_c / 100,
+            "net_cash_flow": (pending_receivables_c - total_payables_c) / 100,
+            "overdue_amount": overdue_amount_c / 100,
             "overdue_count": len(overdue_invoices)
         },
         "overdue_invoices": overdue_invoices,
@@ -403,11 +481,14 @@ def cash_flow_analysis():
 def get_payments():
     """Get all payments"""
     invoice_id = request.args.get('invoice_id')
-    if invoice_id:
-        filtered_payments = [p for p in payments if p['invoice_id'] == invoice_id]
-        return jsonify({"payments": filtered_payments})
+    # Fix the rows up front, under the lock, so only fully recorded payments are streamed
+    with payments_lock:
+        if invoice_id:
+            rows = payment_rows_by_invoice.get(invoice_id, [])[:]
+        else:
+            rows = range(len(payment_columns["id"]))
     
-    return jsonify({"payments": payments})
+    return Response(stream_listing("payments", map(payment_row, rows)), mimetype='application/json')
 
 @app.route('/api/financial/validate-transaction', methods=['POST'])
 def validate_transaction():
@@ -421,8 +502,9 @@ def validate_transaction():
         return jsonify({"error": "Account number required"}), 400
     
     # Get customer invoices
-    customer_invoices = [i for i in invoices.values() if i['customer_account'] == account_number]
-    outstanding_amount = sum(i['amount'] for i in customer_invoices if i['status'] in ['pending', 'overdue'])
+    customer_invoices = [invoices[i] for i in invoices_by_account.get(account_number, ())]
+    outstanding_c = outstanding_by_account.get(account_number, 0)
+    outstanding_amount = outstanding_c / 100
     
     validation_result = {
         "account_number": account_number,
@@ -445,7 +527,7 @@ def validate_transaction():
         validation_result["validation_status"] = "attention_required"
         validation_result["notes"].append(f"Customer has {len(overdue_invoices)} overdue invoices")
     
-    if outstanding_amount > 50000:
+    if outstanding_c > 5_000_000:
         validation_result["validation_status"] = "high_value"
         validation_result["notes"].append("High value customer - manual review recommended")
     
@@ -464,4 +546,4 @@ if __name__ == '__main__':
     print("- GET /api/cash-flow/analysis - Get cash flow analysis")
     print("- GET /api/payments - Get all payments (supports ?invoice_id= filter)")
     print("- POST /api/financial/validate-transaction - Validate transaction against invoices")
-    app.run(debug=True, port=5002)
\ No newline at end of file
+    run_app(app, 5002)
\ No newline at end of file
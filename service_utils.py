@@ -0,0 +1,49 @@
+"""Helpers shared by the mock CRM, ERP and Email services"""
+
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+import itertools
+import os
+import time
+import orjson
+
+class OrjsonProvider(DefaultJSONProvider):
+    """JSON provider backed by orjson for faster response encoding"""
+    
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode()
+    
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+def create_app(import_name):
+    """Create a Flask app that encodes JSON with orjson without sorting keys"""
+    app = Flask(import_name)
+    app.json = OrjsonProvider(app)
+    app.json.sort_keys = False
+    return app
+
+def run_app(app, port, **options):
+    """Run an app on Flask's server; debug mode is opt-in via FLASK_DEBUG=1 and the reloader stays off"""
+    app.run(debug=os.environ.get('FLASK_DEBUG') == '1', port=port, use_reloader=False, **options)
+
+def to_cents(amount) -> int:
+    """Convert a dollar amount to integer cents"""
+    return round(float(amount) * 100)
+
+# Compact monotonic IDs, seeded from the start time in milliseconds so a
+# restarted process is unlikely to reissue earlier IDs
+id_counter = itertools.count(int(time.time() * 1000))
+
+def new_id(prefix):
+    """Return the next unique ID with the given prefix"""
+    return f"{prefix}-{next(id_counter):x}"
+
+def stream_listing(key, items, **meta):
+    """Yield a JSON object holding a list of items one item at a time, followed by meta"""
+    yield b'{"' + key.encode() + b'":['
+    first = True
+    for item in items:
+        yield orjson.dumps(item) if first else b',' + orjson.dumps(item)
+        first = False
+    yield b'],' + orjson.dumps(meta)[1:] if meta else b']}'
@@ -5,9 +5,32 @@ Tests various transaction processing scenarios for agent training
 """
 
 import requests
-import json
+from requests.adapters import HTTPAdapter
+import orjson
+import copy
+import io
+import os
+import statistics
+import sys
+import threading
 import time
+from collections import namedtuple
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
 from datetime import datetime
+from types import MappingProxyType
+
+# Endpoint URL templates, filled in with a service base URL
+HEALTH_URL = "{base}/health"
+CUSTOMER_BY_ACCOUNT_URL = "{base}/customers/by-account/{account}"
+INVOICES_BY_ACCOUNT_URL = "{base}/invoices/by-account/{account}"
+VALIDATE_TRANSACTION_URL = "{base}/financial/validate-transaction"
+SEND_TEMPLATE_EMAIL_URL = "{base}/send-template-email"
+
+# Persistent lookup cache settings (requires the redis package)
+USE_REDIS_CACHE = os.environ.get("USE_REDIS_CACHE") == "1"
+REDIS_URL = os.environ.get("REDIS_URL", "redis://localhost:6379/0")
+REDIS_CACHE_TTL = 300  # seconds
 
 class BusinessSystemTestCases:
     """Test cases for the mock CRM, ERP, and Email systems"""
@@ -17,18 +40,29 @@ class BusinessSystemTestCases:
         self.erp_base_url = "http://localhost:5002/api"
         self.email_base_url = "http://localhost:5000/api"
         
+        # One pooled session so every call reuses keep-alive connections
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=16, pool_maxsize=32)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers.update({"Connection": "keep-alive"})
+        
     def check_services_health(self):
         """Verify all services are running"""
         services = {
-            "CRM": f"{self.crm_base_url}/health",
-            "ERP": f"{self.erp_base_url}/health", 
-            "Email": f"{self.email_base_url}/health"
+            "CRM": HEALTH_URL.format(base=self.crm_base_url),
+            "ERP": HEALTH_URL.format(base=self.erp_base_url),
+            "Email": HEALTH_URL.format(base=self.email_base_url)
         }
         
+        # Probe the services concurrently so one hung service costs a single timeout
+        with ThreadPoolExecutor(max_workers=len(services)) as executor:
+            futures = {service: executor.submit(self.session.get, url, timeout=5) for service, url in services.items()}
+        
         results = {}
-        for service, url in services.items():
+        for service, future in futures.items():
             try:
-                response = requests.get(url, timeout=5)
+                response = future.result()
                 results[service] = response.status_code == 200
                 if results[service]:
                     print(f"✅ {service} service is healthy")
@@ -40,99 +74,192 @@ class BusinessSystemTestCases:
         
         return all(results.values())
 
+@dataclass(slots=True, frozen=True)
+class TxnScenario:
+    """A bank transaction to push through the system and the outcome it should produce"""
+    transaction_id: str
+    account_number: str
+    amount: float
+    type: str
+    description: str
+    timestamp: str
+    reference: str
+    bank_reference: str
+    expected_outcome: str
+    description_text: str
+
 # Test Data Scenarios
 TEST_TRANSACTIONS = {
-    "perfect_match": {
-        "transaction_id": "TXN-PERFECT-001",
-        "account_number": "ACC-789123456",
-        "amount": 12500.00,
-        "type": "credit",
-        "description": "Payment received - Software licensing",
-        "timestamp": "2025-06-10T09:15:00Z",
-        "reference": "INV-2025-001",
-        "bank_reference": "WIRE_TXN_001",
-        "expected_outcome": "auto_process",
-        "description_text": "Exact match - payment equals invoice amount"
-    },
+    "perfect_match": TxnScenario(
+        transaction_id="TXN-PERFECT-001",
+        account_number="ACC-789123456",
+        amount=12500.00,
+        type="credit",
+        description="Payment received - Software licensing",
+        timestamp="2025-06-10T09:15:00Z",
+        reference="INV-2025-001",
+        bank_reference="WIRE_TXN_001",
+        expected_outcome="auto_process",
+        description_text="Exact match - payment equals invoice amount"
+    ),
     
-    "partial_payment": {
-        "transaction_id": "TXN-PARTIAL-002", 
-        "account_number": "ACC-456789123",
-        "amount": 5000.00,
-        "type": "credit",
-        "description": "Partial payment - Consulting services",
-        "timestamp": "2025-06-10T14:30:00Z",
-        "reference": "INV-2025-002",
-        "bank_reference": "ACH_PARTIAL_001",
-        "expected_outcome": "review_and_process",
-        "description_text": "Partial payment - less than invoice amount"
-    },
+    "partial_payment": TxnScenario(
+        transaction_id="TXN-PARTIAL-002",
+        account_number="ACC-456789123",
+        amount=5000.00,
+        type="credit",
+        description="Partial payment - Consulting services",
+        timestamp="2025-06-10T14:30:00Z",
+        reference="INV-2025-002",
+        bank_reference="ACH_PARTIAL_001",
+        expected_outcome="review_and_process",
+        description_text="Partial payment - less than invoice amount"
+    ),
     
-    "unknown_customer": {
-        "transaction_id": "TXN-UNKNOWN-003",
-        "account_number": "ACC-999888777",
-        "amount": 15000.00,
-        "type": "credit", 
-        "description": "Unknown payment source",
-        "timestamp": "2025-06-10T16:45:00Z",
-        "reference": "UNKNOWN_REF",
-        "bank_reference": "MYSTERY_PAYMENT",
-        "expected_outcome": "manual_review",
-        "description_text": "Customer not found in CRM system"
-    },
+    "unknown_customer": TxnScenario(
+        transaction_id="TXN-UNKNOWN-003",
+        account_number="ACC-999888777",
+        amount=15000.00,
+        type="credit",
+        description="Unknown payment source",
+        timestamp="2025-06-10T16:45:00Z",
+        reference="UNKNOWN_REF",
+        bank_reference="MYSTERY_PAYMENT",
+        expected_outcome="manual_review",
+        description_text="Customer not found in CRM system"
+    ),
     
-    "high_value_payment": {
-        "transaction_id": "TXN-HIGHVAL-004",
-        "account_number": "ACC-123456789",
-        "amount": 75000.00,
-        "type": "credit",
-        "description": "Large payment - requires review", 
-        "timestamp": "2025-06-10T17:20:00Z",
-        "reference": "BULK-PAYMENT-Q2",
-        "bank_reference": "HIGH_VALUE_001",
-        "expected_outcome": "manual_review",
-        "description_text": "High value payment from suspended customer"
-    },
+    "high_value_payment": TxnScenario(
+        transaction_id="TXN-HIGHVAL-004",
+        account_number="ACC-123456789",
+        amount=75000.00,
+        type="credit",
+        description="Large payment - requires review",
+        timestamp="2025-06-10T17:20:00Z",
+        reference="BULK-PAYMENT-Q2",
+        bank_reference="HIGH_VALUE_001",
+        expected_outcome="manual_review",
+        description_text="High value payment from suspended customer"
+    ),
     
-    "overpayment": {
-        "transaction_id": "TXN-OVERPAY-005",
-        "account_number": "ACC-789123456", 
-        "amount": 25000.00,
-        "type": "credit",
-        "description": "Overpayment scenario",
-        "timestamp": "2025-06-10T18:00:00Z",
-        "reference": "OVERPAY_TEST",
-        "bank_reference": "EXCESS_PAYMENT",
-        "expected_outcome": "review_and_process",
-        "description_text": "Payment exceeds outstanding invoice amount"
-    },
+    "overpayment": TxnScenario(
+        transaction_id="TXN-OVERPAY-005",
+        account_number="ACC-789123456",
+        amount=25000.00,
+        type="credit",
+        description="Overpayment scenario",
+        timestamp="2025-06-10T18:00:00Z",
+        reference="OVERPAY_TEST",
+        bank_reference="EXCESS_PAYMENT",
+        expected_outcome="review_and_process",
+        description_text="Payment exceeds outstanding invoice amount"
+    ),
     
-    "suspended_customer": {
-        "transaction_id": "TXN-SUSPENDED-006",
-        "account_number": "ACC-123456789",
-        "amount": 10000.00,
-        "type": "credit",
-        "description": "Payment from suspended account",
-        "timestamp": "2025-06-10T19:15:00Z", 
-        "reference": "SUSPENDED_PAY",
-        "bank_reference": "SUSP_PAYMENT",
-        "expected_outcome": "hold",
-        "description_text": "Payment from customer with suspended status"
-    },
+    "suspended_customer": TxnScenario(
+        transaction_id="TXN-SUSPENDED-006",
+        account_number="ACC-123456789",
+        amount=10000.00,
+        type="credit",
+        description="Payment from suspended account",
+        timestamp="2025-06-10T19:15:00Z",
+        reference="SUSPENDED_PAY",
+        bank_reference="SUSP_PAYMENT",
+        expected_outcome="hold",
+        description_text="Payment from customer with suspended status"
+    ),
     
-    "zero_amount": {
-        "transaction_id": "TXN-ZERO-010",
-        "account_number": "ACC-789123456",
-        "amount": 0.00,
-        "type": "credit",
-        "description": "Zero amount transaction",
-        "timestamp": "2025-06-10T23:15:00Z",
-        "reference": "ZERO_TEST",
-        "bank_reference": "ZERO_AMT",
-        "expected_outcome": "error",
-        "description_text": "Invalid zero amount transaction"
-    }
+    "zero_amount": TxnScenario(
+        transaction_id="TXN-ZERO-010",
+        account_number="ACC-789123456",
+        amount=0.00,
+        type="credit",
+        description="Zero amount transaction",
+        timestamp="2025-06-10T23:15:00Z",
+        reference="ZERO_TEST",
+        bank_reference="ZERO_AMT",
+        expected_outcome="error",
+        description_text="Invalid zero amount transaction"
+    )
+}
+
+# Scenarios in menu order, materialized once
+TEST_ITEMS = tuple(TEST_TRANSACTIONS.items())
+
+# Decision outcomes produced by TransactionTestRunner.make_decision
+Decision = namedtuple('Decision', ['action', 'confidence', 'reasons', 'next_steps', 'include_notes'], defaults=(False,))
+
+CUSTOMER_NOT_FOUND = Decision("manual_review", 0.0, ("Customer not found in CRM",), ("Research customer or return payment",))
+CUSTOMER_SUSPENDED = Decision("hold", 0.9, ("Customer account is suspended",), ("Contact customer service team",))
+INVALID_AMOUNT = Decision("error", 1.0, ("Invalid transaction amount",), ("Reject transaction",))
+HIGH_VALUE = Decision("manual_review", 0.3, ("High value payment requires manual approval",), ("Manager approval required",))
+
+# (customer_found, customer_suspended, amount_bucket) -> decision. None means the
+# outcome depends on the ERP validation result.
+DECISION_TABLE = {
+    (True, False, "zero"): INVALID_AMOUNT,
+    (True, False, "high"): HIGH_VALUE,
+    (True, False, "normal"): None
+}
+for amount_bucket in ("zero", "high", "normal"):
+    DECISION_TABLE[(False, False, amount_bucket)] = CUSTOMER_NOT_FOUND
+    DECISION_TABLE[(True, True, amount_bucket)] = CUSTOMER_SUSPENDED
+
+# ERP validation_status -> decision, with VALIDATION_REVIEW for any other status
+VALIDATION_DECISIONS = {
+    "approved": Decision("auto_process", 0.95, ("All validations passed",), ("Process payment automatically",)),
+    "warning": Decision("review_and_process", 0.7, (), ("Review payment amount vs outstanding invoices",), True)
 }
+VALIDATION_REVIEW = Decision("manual_review", 0.3, (), ("Manual review required",), True)
+VALIDATION_UNAVAILABLE = Decision("manual_review", 0.2, ("Unable to validate transaction",), ("Manual validation required",))
+
+# Decision action -> email template to notify with
+TEMPLATE_MAP = MappingProxyType({
+    "manual_review": "unknown_customer",
+    "hold": "suspended_customer_payment",
+    "review_and_process": "payment_mismatch",
+    "auto_process": None,  # No notification needed for auto-processed
+    "error": "payment_mismatch"
+})
+
+# Template fields that are the same for every notification sent by the runner
+STATIC_EMAIL_FIELDS = {
+    "customer_name": "Test Customer",
+    "customer_email": "test@example.com",
+    "customer_status": "active",
+    "outstanding_invoices": "See ERP system for details"
+}
+JSON_HEADERS = {"Content-Type": "application/json"}
+
+class Step:
+    """Outcome of one step of a test scenario"""
+    __slots__ = ("name", "success", "data", "error", "skipped")
+    
+    def __init__(self, name, success=False, data=None, error=None, skipped=False):
+        self.name = name
+        self.success = success
+        self.data = data
+        self.error = error
+        self.skipped = skipped
+    
+    def to_dict(self):
+        """Return the step as a JSON-friendly dict that from_dict can rebuild"""
+        return {"name": self.name, "success": self.success, "data": self.data, "error": self.error, "skipped": self.skipped}
+    
+    @classmethod
+    def from_dict(cls, fields):
+        """Rebuild a step from the dict form produced by to_dict"""
+        return cls(**fields)
+
+class DecisionStep(Step):
+    """Outcome of the decision-making step"""
+    __slots__ = ("action", "confidence", "reasons", "next_steps")
+    
+    def __init__(self, action, confidence, reasons, next_steps):
+        super().__init__("decision_making", success=True)
+        self.action = action
+        self.confidence = confidence
+        self.reasons = reasons
+        self.next_steps = next_steps
 
 class TransactionTestRunner:
     """Runs comprehensive tests on transaction processing scenarios"""
@@ -140,6 +267,65 @@ class TransactionTestRunner:
     def __init__(self):
         self.test_system = BusinessSystemTestCases()
         self.results = []
+        # Shared pool for the independent lookups issued within a single test
+        self.lookup_executor = ThreadPoolExecutor(max_workers=16)
+        # Customer and invoice lookups by account number, shared by the scenarios of a run
+        self.customer_cache = {}
+        self.invoice_cache = {}
+        self.cache_lock = threading.Lock()
+        
+        # Optional Redis cache that keeps lookups across runs; opt in with USE_REDIS_CACHE=1
+        self.redis = None
+        if USE_REDIS_CACHE:
+            import redis
+            self.redis = redis.Redis.from_url(REDIS_URL)
+            self.redis_error = redis.exceptions.RedisError
+    
+    def clear_caches(self):
+        """Forget cached lookups so the next run sees current CRM and ERP data"""
+        with self.cache_lock:
+            self.customer_cache.clear()
+            self.invoice_cache.clear()
+    
+    def cached_lookup(self, cache, url_template, base_url, account_number, fetch):
+        """Return a copy of the cached step for account_number, fetching it once if needed"""
+        with self.cache_lock:
+            future = cache.get(account_number)
+            is_owner = future is None
+            if is_owner:
+                future = cache[account_number] = Future()
+        
+        # Concurrent scenarios for the same account wait on the first fetch
+        if is_owner:
+            try:
+                # Key the persistent cache on the full request URL so different servers never share entries
+                key = "lookup:" + url_template.format(base=base_url, account=account_number)
+                future.set_result(self.persistent_lookup(key, account_number, fetch))
+            except Exception as e:
+                future.set_exception(e)
+        return copy.copy(future.result())
+    
+    def persistent_lookup(self, key, account_number, fetch):
+        """Fetch a lookup step, going through the Redis cache when it is enabled"""
+        if self.redis is None:
+            return fetch(account_number)
+        
+        # The cache is optional: if Redis is unreachable, fall back to the live lookup
+        try:
+            cached = self.redis.get(key)
+        except self.redis_error:
+            return fetch(account_number)
+        if cached is not None:
+            return Step.from_dict(orjson.loads(cached))
+        
+        # Only successful lookups are kept, so failures are retried on the next run
+        step = fetch(account_number)
+        if step.success:
+            try:
+                self.redis.setex(key, REDIS_CACHE_TTL, orjson.dumps(step.to_dict()))
+            except self.redis_error:
+                pass
+        return step
         
     def run_all_tests(self):
         """Execute all test scenarios"""
@@ -156,18 +342,25 @@ class TransactionTestRunner:
             return False
             
         print("✅ All services are healthy. Running test scenarios...\n")
+        self.clear_caches()
         
-        # Run each test scenario
-        for test_name, transaction in TEST_TRANSACTIONS.items():
-            print(f"🧪 Testing: {test_name}")
-            print(f"   Scenario: {transaction['description_text']}")
+        # Scenarios are independent and I/O-bound, so run them concurrently and
+        # print the results in scenario order once they have all finished
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            results = list(executor.map(lambda item: self.run_single_test(*item), TEST_ITEMS))
+        
+        for (test_name, transaction), result in zip(TEST_ITEMS, results):
+            # Buffer each scenario's report and write it out in one go
+            buf = io.StringIO()
+            print(f"🧪 Testing: {test_name}", file=buf)
+            print(f"   Scenario: {transaction.description_text}", file=buf)
             
-            result = self.run_single_test(test_name, transaction)
             self.results.append(result)
             
-            self.print_test_result(result)
-            print("-" * 40)
-            time.sleep(1)  # Brief pause between tests
+            self.print_test_result(result, buf)
+            print("-" * 40, file=buf)
+            sys.stdout.write(buf.getvalue())
+            sys.stdout.flush()
             
         self.print_summary()
         return True
@@ -180,30 +373,39 @@ class TransactionTestRunner:
             "steps": [],
             "success": False,
             "actual_outcome": None,
-            "expected_outcome": transaction["expected_outcome"],
+            "expected_outcome": transaction.expected_outcome,
             "errors": [],
             "execution_time": 0
         }
         
-        start_time = time.time()
+        start_time = time.perf_counter()
         
         try:
-            # Step 1: Check customer exists
-            customer_step = self.check_customer_exists(transaction["account_number"])
-            result["steps"].append(customer_step)
+            if transaction.amount <= 0:
+                # A non-positive amount is never decided by ERP, so only the customer
+                # lookup (which can still route it to review or hold) is needed
+                customer_step = self.check_customer_exists(transaction.account_number)
+                invoices_step = Step("invoice_lookup", success=True, skipped=True)
+                validation_step = Step("transaction_validation", success=True, skipped=True)
+            else:
+                # Steps 1-3 are independent lookups, so issue them concurrently:
+                # check customer exists, get customer invoices, validate transaction
+                customer_future = self.lookup_executor.submit(self.check_customer_exists, transaction.account_number)
+                invoices_future = self.lookup_executor.submit(self.get_customer_invoices, transaction.account_number)
+                validation_future = self.lookup_executor.submit(self.validate_transaction, transaction)
+                
+                customer_step = customer_future.result()
+                invoices_step = invoices_future.result()
+                validation_step = validation_future.result()
             
-            # Step 2: Get customer invoices 
-            invoices_step = self.get_customer_invoices(transaction["account_number"])
+            result["steps"].append(customer_step)
             result["steps"].append(invoices_step)
-            
-            # Step 3: Validate transaction
-            validation_step = self.validate_transaction(transaction)
             result["steps"].append(validation_step)
             
             # Step 4: Determine expected action
             decision_step = self.make_decision(transaction, customer_step, invoices_step, validation_step)
             result["steps"].append(decision_step)
-            result["actual_outcome"] = decision_step.get("action", "unknown")
+            result["actual_outcome"] = decision_step.action
             
             # Step 5: Send appropriate notifications
             notification_step = self.send_notifications(transaction, decision_step)
@@ -215,254 +417,202 @@ class TransactionTestRunner:
         except Exception as e:
             result["errors"].append(f"Test execution error: {str(e)}")
             
-        result["execution_time"] = time.time() - start_time
+        result["execution_time"] = time.perf_counter() - start_time
         return result
     
     def check_customer_exists(self, account_number):
         """Test customer lookup in CRM"""
-        step = {
-            "step": "customer_lookup",
-            "success": False,
-            "data": None,
-            "error": None
-        }
+        return self.cached_lookup(self.customer_cache, CUSTOMER_BY_ACCOUNT_URL, self.test_system.crm_base_url, account_number, self.fetch_customer)
+    
+    def fetch_customer(self, account_number):
+        """Look up a customer in CRM"""
+        step = Step("customer_lookup")
         
         try:
-            url = f"{self.test_system.crm_base_url}/customers/by-account/{account_number}"
-            response = requests.get(url, timeout=5)
+            url = CUSTOMER_BY_ACCOUNT_URL.format(base=self.test_system.crm_base_url, account=account_number)
+            response = self.test_system.session.get(url, timeout=5)
             
-            step["success"] = response.status_code == 200
-            if step["success"]:
-                step["data"] = response.json()
+            step.success = response.status_code == 200
+            if step.success:
+                step.data = response.json()
             else:
-                step["error"] = f"Customer not found (Status: {response.status_code})"
+                step.error = f"Customer not found (Status: {response.status_code})"
                 
         except Exception as e:
-            step["error"] = f"CRM API Error: {str(e)}"
+            step.error = f"CRM API Error: {str(e)}"
             
         return step
     
     def get_customer_invoices(self, account_number):
         """Test invoice lookup in ERP"""
-        step = {
-            "step": "invoice_lookup",
-            "success": False,
-            "data": None,
-            "error": None
-        }
+        return self.cached_lookup(self.invoice_cache, INVOICES_BY_ACCOUNT_URL, self.test_system.erp_base_url, account_number, self.fetch_invoices)
+    
+    def fetch_invoices(self, account_number):
+        """Look up a customer's invoices in ERP"""
+        step = Step("invoice_lookup")
         
         try:
-            url = f"{self.test_system.erp_base_url}/invoices/by-account/{account_number}"
-            response = requests.get(url, timeout=5)
+            url = INVOICES_BY_ACCOUNT_URL.format(base=self.test_system.erp_base_url, account=account_number)
+            response = self.test_system.session.get(url, timeout=5)
             
-            step["success"] = response.status_code == 200
-            if step["success"]:
-                step["data"] = response.json()
+            step.success = response.status_code == 200
+            if step.success:
+                step.data = response.json()
             else:
-                step["error"] = f"Invoices not found (Status: {response.status_code})"
+                step.error = f"Invoices not found (Status: {response.status_code})"
                 
         except Exception as e:
-            step["error"] = f"ERP API Error: {str(e)}"
+            step.error = f"ERP API Error: {str(e)}"
             
         return step
     
     def validate_transaction(self, transaction):
         """Test transaction validation in ERP"""
-        step = {
-            "step": "transaction_validation",
-            "success": False,
-            "data": None,
-            "error": None
-        }
+        step = Step("transaction_validation")
         
         try:
-            url = f"{self.test_system.erp_base_url}/financial/validate-transaction"
+            url = VALIDATE_TRANSACTION_URL.format(base=self.test_system.erp_base_url)
             payload = {
-                "account_number": transaction["account_number"],
-                "amount": transaction["amount"],
-                "type": "payment" if transaction["type"] == "credit" else "charge",
-                "transaction_id": transaction["transaction_id"]
+                "account_number": transaction.account_number,
+                "amount": transaction.amount,
+                "type": "payment" if transaction.type == "credit" else "charge",
+                "transaction_id": transaction.transaction_id
             }
-            response = requests.post(url, json=payload, timeout=5)
+            response = self.test_system.session.post(url, json=payload, timeout=5)
             
-            step["success"] = response.status_code == 200
-            if step["success"]:
-                step["data"] = response.json()
+            step.success = response.status_code == 200
+            if step.success:
+                step.data = response.json()
             else:
-                step["error"] = f"Validation failed (Status: {response.status_code})"
+                step.error = f"Validation failed (Status: {response.status_code})"
                 
         except Exception as e:
-            step["error"] = f"Validation API Error: {str(e)}"
+            step.error = f"Validation API Error: {str(e)}"
             
         return step
     
     def make_decision(self, transaction, customer_step, invoices_step, validation_step):
         """Test decision-making logic"""
-        step = {
-            "step": "decision_making",
-            "success": True,
-            "action": "unknown",
-            "confidence": 0.0,
-            "reasons": [],
-            "next_steps": []
-        }
-        
-        # Customer not found
-        if not customer_step["success"]:
-            step["action"] = "manual_review"
-            step["confidence"] = 0.0
-            step["reasons"].append("Customer not found in CRM")
-            step["next_steps"].append("Research customer or return payment")
-            return step
-        
-        customer = customer_step.get("data", {})
-        
-        # Customer suspended
-        if customer.get("status") == "suspended":
-            step["action"] = "hold"
-            step["confidence"] = 0.9
-            step["reasons"].append("Customer account is suspended")
-            step["next_steps"].append("Contact customer service team")
-            return step
+        customer_found = customer_step.success
+        customer_suspended = customer_found and customer_step.data.get("status") == "suspended"
+        amount = transaction.amount
+        amount_bucket = "zero" if amount <= 0 else "high" if amount > 50000 else "normal"
         
-        # Zero amount
-        if transaction["amount"] <= 0:
-            step["action"] = "error"
-            step["confidence"] = 1.0
-            step["reasons"].append("Invalid transaction amount")
-            step["next_steps"].append("Reject transaction")
-            return step
-        
-        # High value payment
-        if transaction["amount"] > 50000:
-            step["action"] = "manual_review"
-            step["confidence"] = 0.3
-            step["reasons"].append("High value payment requires manual approval")
-            step["next_steps"].append("Manager approval required")
-            return step
-        
-        # Check validation results
-        if validation_step["success"]:
-            validation = validation_step.get("data", {})
-            if validation.get("validation_status") == "approved":
-                step["action"] = "auto_process"
-                step["confidence"] = 0.95
-                step["reasons"].append("All validations passed")
-                step["next_steps"].append("Process payment automatically")
-            elif validation.get("validation_status") == "warning":
-                step["action"] = "review_and_process"
-                step["confidence"] = 0.7
-                step["reasons"].extend(validation.get("notes", []))
-                step["next_steps"].append("Review payment amount vs outstanding invoices")
+        decision = DECISION_TABLE[(customer_found, customer_suspended, amount_bucket)]
+        notes = ()
+        if decision is None:
+            # Ordinary payment from a customer in good standing: let ERP validation decide
+            if validation_step.success:
+                validation = validation_step.data
+                decision = VALIDATION_DECISIONS.get(validation.get("validation_status"), VALIDATION_REVIEW)
+                if decision.include_notes:
+                    notes = validation.get("notes", [])
             else:
-                step["action"] = "manual_review"
-                step["confidence"] = 0.3
-                step["reasons"].extend(validation.get("notes", []))
-                step["next_steps"].append("Manual review required")
-        else:
-            step["action"] = "manual_review"
-            step["confidence"] = 0.2
-            step["reasons"].append("Unable to validate transaction")
-            step["next_steps"].append("Manual validation required")
+                decision = VALIDATION_UNAVAILABLE
         
-        return step
+        return DecisionStep(
+            action=decision.action,
+            confidence=decision.confidence,
+            reasons=(*decision.reasons, *notes),
+            next_steps=decision.next_steps
+        )
     
     def send_notifications(self, transaction, decision_step):
         """Test email notification system"""
-        step = {
-            "step": "notification",
-            "success": False,
-            "data": None,
-            "error": None
-        }
+        step = Step("notification")
         
         try:
             # Determine appropriate email template
-            template_map = {
-                "manual_review": "unknown_customer",
-                "hold": "suspended_customer_payment", 
-                "review_and_process": "payment_mismatch",
-                "auto_process": None,  # No notification needed for auto-processed
-                "error": "payment_mismatch"
-            }
-            
-            template = template_map.get(decision_step["action"])
+            template = TEMPLATE_MAP.get(decision_step.action)
             
             if template:
-                url = f"{self.test_system.email_base_url}/send-template-email"
+                url = SEND_TEMPLATE_EMAIL_URL.format(base=self.test_system.email_base_url)
                 payload = {
                     "template": template,
-                    "data": {
-                        "transaction_id": transaction["transaction_id"],
-                        "account_number": transaction["account_number"],
-                        "amount": str(transaction["amount"]),
-                        "transaction_date": transaction["timestamp"],
-                        "reference": transaction["reference"],
-                        "customer_name": "Test Customer",
-                        "customer_email": "test@example.com",
-                        "customer_status": "active",
-                        "issue_description": "; ".join(decision_step["reasons"]),
-                        "action_required": "; ".join(decision_step["next_steps"]),
-                        "outstanding_invoices": "See ERP system for details",
-                        "description": transaction["description"]
+                    "data": STATIC_EMAIL_FIELDS | {
+                        "transaction_id": transaction.transaction_id,
+                        "account_number": transaction.account_number,
+                        "amount": str(transaction.amount),
+                        "transaction_date": transaction.timestamp,
+                        "reference": transaction.reference,
+                        "issue_description": "; ".join(decision_step.reasons),
+                        "action_required": "; ".join(decision_step.next_steps),
+                        "description": transaction.description
                     }
                 }
-                response = requests.post(url, json=payload, timeout=5)
-                step["success"] = response.status_code == 200
-                if step["success"]:
-                    step["data"] = response.json()
+                response = self.test_system.session.post(url, data=orjson.dumps(payload), headers=JSON_HEADERS, timeout=5)
+                step.success = response.status_code == 200
+                if step.success:
+                    step.data = response.json()
                 else:
-                    step["error"] = f"Email failed (Status: {response.status_code})"
+                    step.error = f"Email failed (Status: {response.status_code})"
             else:
-                step["success"] = True
-                step["data"] = {"message": "No notification required"}
+                step.success = True
+                step.data = {"message": "No notification required"}
                 
         except Exception as e:
-            step["error"] = f"Email API Error: {str(e)}"
+            step.error = f"Email API Error: {str(e)}"
             
         return step
     
-    def print_test_result(self, result):
-        """Print formatted test result"""
+    def print_test_result(self, result, out=None):
+        """Print formatted test result, into out if given or else straight to stdout"""
+        buf = io.StringIO() if out is None else out
         status_icon = "✅" if result["success"] else "❌"
-        print(f"   {status_icon} Expected: {result['expected_outcome']} | Actual: {result['actual_outcome']}")
-        print(f"   ⏱️  Execution time: {result['execution_time']:.2f}s")
+        print(f"   {status_icon} Expected: {result['expected_outcome']} | Actual: {result['actual_outcome']}", file=buf)
+        print(f"   ⏱️  Execution time: {result['execution_time'] * 1000:.1f}ms", file=buf)
         
         if result["errors"]:
             for error in result["errors"]:
-                print(f"   ⚠️  Error: {error}")
+                print(f"   ⚠️  Error: {error}", file=buf)
         
         # Show step results
         for step in result["steps"]:
-            step_icon = "✅" if step["success"] else "❌"
-            print(f"   {step_icon} {step['step']}")
-            if step.get("error"):
-                print(f"      ⚠️  {step['error']}")
+            if step.skipped:
+                print(f"   ⏭️  {step.name} (skipped)", file=buf)
+                continue
+            step_icon = "✅" if step.success else "❌"
+            print(f"   {step_icon} {step.name}", file=buf)
+            if step.error:
+                print(f"      ⚠️  {step.error}", file=buf)
+        
+        if out is None:
+            sys.stdout.write(buf.getvalue())
+            sys.stdout.flush()
     
     def print_summary(self):
         """Print test summary"""
-        print("\n" + "=" * 60)
-        print("📊 TEST SUMMARY")
-        print("=" * 60)
+        buf = io.StringIO()
+        print("\n" + "=" * 60, file=buf)
+        print("📊 TEST SUMMARY", file=buf)
+        print("=" * 60, file=buf)
         
         total_tests = len(self.results)
         passed_tests = sum(1 for r in self.results if r["success"])
         failed_tests = total_tests - passed_tests
         
-        print(f"Total Tests: {total_tests}")
-        print(f"Passed: {passed_tests} ✅")
-        print(f"Failed: {failed_tests} ❌")
-        print(f"Success Rate: {(passed_tests/total_tests)*100:.1f}%")
+        print(f"Total Tests: {total_tests}", file=buf)
+        print(f"Passed: {passed_tests} ✅", file=buf)
+        print(f"Failed: {failed_tests} ❌", file=buf)
+        print(f"Success Rate: {(passed_tests/total_tests)*100:.1f}%", file=buf)
         
         if failed_tests > 0:
-            print(f"\n❌ Failed Tests:")
+            print(f"\n❌ Failed Tests:", file=buf)
             for result in self.results:
                 if not result["success"]:
-                    print(f"   • {result['test_name']}: Expected {result['expected_outcome']}, got {result['actual_outcome']}")
+                    print(f"   • {result['test_name']}: Expected {result['expected_outcome']}, got {result['actual_outcome']}", file=buf)
+        
+        print(f"\n📈 Performance:", file=buf)
+        times = [r["execution_time"] for r in self.results]
+        print(f"   Average execution time: {statistics.fmean(times) * 1000:.1f}ms", file=buf)
+        print(f"   Median execution time: {statistics.median(times) * 1000:.1f}ms", file=buf)
+        if len(times) > 1:
+            p95_time = statistics.quantiles(times, n=20, method="inclusive")[18]
+            print(f"   95th percentile execution time: {p95_time * 1000:.1f}ms", file=buf)
+        print(f"   Slowest execution time: {max(times) * 1000:.1f}ms", file=buf)
         
-        print(f"\n📈 Performance:")
-        avg_time = sum(r["execution_time"] for r in self.results) / total_tests
-        print(f"   Average execution time: {avg_time:.2f}s")
+        sys.stdout.write(buf.getvalue())
+        sys.stdout.flush()
 
 def run_interactive_test():
     """Interactive test runner with menu"""
@@ -486,16 +636,15 @@ def run_interactive_test():
             
         elif choice == "2":
             print("\nAvailable test scenarios:")
-            for i, (name, data) in enumerate(TEST_TRANSACTIONS.items(), 1):
-                print(f"{i}. {name} - {data['description_text']}")
+            for i, (name, data) in enumerate(TEST_ITEMS, 1):
+                print(f"{i}. {name} - {data.description_text}")
             
             try:
                 test_num = int(input("\nSelect test number: ")) - 1
-                test_names = list(TEST_TRANSACTIONS.keys())
-                if 0 <= test_num < len(test_names):
-                    test_name = test_names[test_num]
-                    transaction = TEST_TRANSACTIONS[test_name]
+                if 0 <= test_num < len(TEST_ITEMS):
+                    test_name, transaction = TEST_ITEMS[test_num]
                     print(f"\n🧪 Running: {test_name}")
+                    runner.clear_caches()
                     result = runner.run_single_test(test_name, transaction)
                     runner.print_test_result(result)
                 else:
@@ -505,9 +654,9 @@ def run_interactive_test():
                 
         elif choice == "3":
             print("\n📋 Available Test Scenarios:")
-            for name, data in TEST_TRANSACTIONS.items():
-                print(f"• {name}: {data['description_text']}")
-                print(f"  Expected outcome: {data['expected_outcome']}")
+            for name, data in TEST_ITEMS:
+                print(f"• {name}: {data.description_text}")
+                print(f"  Expected outcome: {data.expected_outcome}")
                 print()
                 
         elif choice == "4":
@@ -519,7 +668,7 @@ def run_interactive_test():
                 
         elif choice == "5":
             print("\n💾 Sample Transaction Data:")
-            print(json.dumps(list(TEST_TRANSACTIONS.values())[0], indent=2))
+            print(orjson.dumps(TEST_ITEMS[0][1], option=orjson.OPT_INDENT_2).decode())
             
         elif choice == "6":
             print("👋 Goodbye!")
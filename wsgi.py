@@ -0,0 +1,8 @@
+"""
+WSGI entry points for running the mock services under a production WSGI
+server (e.g. gunicorn) instead of the Werkzeug development server.
+"""
+
+from mock_crm import app as crm_app
+from mock_erp import app as erp_app
+from mock_email import app as email_app